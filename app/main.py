@@ -1,6 +1,7 @@
 from fastapi import FastAPI, Request, Form
 from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
+from utility.http_cache import StaticPage
 from preprocessing.preprocess import preprocess_router
 from settings.config import settings_router
 from research_agent.agent import agent_router
@@ -19,11 +20,10 @@ app.include_router(preprocess_quiz_router, prefix="/preprocess/quiz", tags=["pre
 static_path = os.path.join(os.path.dirname(__file__), "static")
 app.mount("/static", StaticFiles(directory=static_path), name="static")
 
+home_page = StaticPage("index.html")
+
 @app.get("/", response_class=HTMLResponse)
-async def home():
-    html_path = os.path.join(os.path.dirname(__file__), "static", "index.html")
-    with open(html_path, encoding="utf-8") as f:
-        content = f.read()
-    return HTMLResponse(content=content, status_code=200)
+async def home(request: Request):
+    return home_page.response(request)
 
 
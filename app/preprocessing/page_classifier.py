@@ -0,0 +1,71 @@
+import io
+
+import fitz  # PyMuPDF
+from PIL import Image
+
+BLANK = "blank"
+TEXT = "text"
+VISION = "vision"
+
+# Pages with at most this many words (page numbers, section titles) and no
+# images or drawings are blank, covers or separators
+MAX_BLANK_WORDS = 2
+# Pages with fewer words than this may rely on a figure for their question
+MIN_WORDS = 15
+# Images covering less than this share of the page are logos or decorations
+MIN_IMAGE_COVERAGE = 0.05
+# Up to this many vector paths are rules, borders or underlines, not figures
+MAX_DECORATION_DRAWINGS = 2
+# Above this share the page needs the image path, e.g. scans or question figures
+MAX_TEXT_PATH_IMAGE_COVERAGE = 0.3
+# Born-digital pages with this many vector paths likely carry diagrams or tables
+MAX_TEXT_PATH_DRAWINGS = 40
+# Text layers with more undecodable characters than this are treated as scans
+MAX_GARBLED_RATIO = 0.05
+
+
+def image_coverage(page: fitz.Page) -> float:
+    """Share of the page area covered by embedded images (0-1)."""
+    page_area = page.rect.get_area()
+    if not page_area:
+        return 0.0
+    covered = 0.0
+    for image in page.get_images(full=True):
+        for rect in page.get_image_rects(image[0]):
+            covered += (rect & page.rect).get_area()
+    return min(covered / page_area, 1.0)
+
+
+def garbled_ratio(text: str) -> float:
+    if not text:
+        return 0.0
+    bad = sum(1 for ch in text if ch == "�" or (not ch.isprintable() and not ch.isspace()))
+    return bad / len(text)
+
+
+def classify_page(page: fitz.Page):
+    """
+    Decide how a PDF page should be processed. Returns (path, text) where path
+    is BLANK (skip it), TEXT (its text layer is enough) or VISION (render it).
+    """
+    text = page.get_text("text").strip()
+    words = len(text.split())
+    coverage = image_coverage(page)
+    drawings = len(page.get_drawings())
+    has_figure = coverage >= MIN_IMAGE_COVERAGE or drawings > MAX_DECORATION_DRAWINGS
+
+    if words <= MAX_BLANK_WORDS and not has_figure:
+        return BLANK, text
+    if garbled_ratio(text) > MAX_GARBLED_RATIO:
+        return VISION, text
+    if words < MIN_WORDS:
+        # A one-line question is fine as text, unless it points at a figure
+        return (VISION if has_figure else TEXT), text
+    if coverage <= MAX_TEXT_PATH_IMAGE_COVERAGE and drawings <= MAX_TEXT_PATH_DRAWINGS:
+        return TEXT, text
+    return VISION, text
+
+
+def render_page_image(page: fitz.Page, dpi: int = 300) -> Image.Image:
+    pix = page.get_pixmap(dpi=dpi)
+    return Image.open(io.BytesIO(pix.tobytes("png")))
@@ -1,7 +1,7 @@
 from io import BytesIO
 import pymupdf as fitz
 import os
-from fastapi import APIRouter
+from fastapi import APIRouter, Request
 from fastapi.responses import HTMLResponse, StreamingResponse, JSONResponse
 from bson import ObjectId
 from langchain_core.prompts import PromptTemplate
@@ -12,6 +12,8 @@ from prompt_templates import content_extraction_prompt
 from pydantic import BaseModel
 from google.cloud import storage
 from utility.mongo_client import db
+from utility.http_cache import StaticPage, json_response
+from utility.shared_state import get_shared_state
 
 class PDFRequest(BaseModel):
     pdf_path: str
@@ -25,11 +27,15 @@ BUCKET_NAME = os.getenv("BUCKET_NAME")
 RAW_DATA_PREFIX = os.getenv("RAW_DATA_PREFIX", "raw-data/")
 PROCESSED_DATA_PREFIX = os.getenv("MARKDOWN_PROCESSED_DATA_PREFIX", "processed-data/markdowns/")
 GOOGLE_APPLICATION_CREDENTIALS = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
+# Bucket listings are shared between workers for this long, so polling stays cheap
+LIST_FILES_CACHE_SECONDS = int(os.getenv("LIST_FILES_CACHE_SECONDS", "30"))
+LIST_FILES_CACHE_KEY = "preprocess:list-files"
 
 storage_client = storage.Client()
 prompt_collection = db["prompts"]
 
 preprocess_router = APIRouter()
+home_page = StaticPage("preprocess.html")
 
 
 llm = ChatGoogleGenerativeAI(
@@ -45,14 +51,19 @@ def extract_text_from_pdf(pdf_bytes: bytes) -> str:
     return "\n".join(page.get_text() for page in reader)
 
 @preprocess_router.get("/", response_class=HTMLResponse)
-async def home():
-    html_path = os.path.join(os.path.dirname(__file__), "..", "static", "preprocess.html")
-    with open(html_path, encoding="utf-8") as f:
-        content = f.read()
-    return HTMLResponse(content=content, status_code=200)
+async def home(request: Request):
+    return home_page.response(request)
 
 @preprocess_router.get("/list-files")
-def list_files():
+def list_files(request: Request):
+    shared_state = get_shared_state()
+    listing = shared_state.get(LIST_FILES_CACHE_KEY)
+    if listing is None:
+        listing = list_bucket_files()
+        shared_state.set(LIST_FILES_CACHE_KEY, listing, ttl=LIST_FILES_CACHE_SECONDS)
+    return json_response(request, listing)
+
+def list_bucket_files() -> dict:
     bucket = storage_client.bucket(BUCKET_NAME)
 
     # Get all PDF and MD files
@@ -78,8 +89,9 @@ def list_files():
         for path in normalized_pdfs - normalized_mds
     ]
 
+    # Sorted so the body, and therefore the ETag, is stable across processes
     unprocessed_pdfs = [
-        "raw-data/" + path + ".pdf" for path in normalized_pdfs
+        "raw-data/" + path + ".pdf" for path in sorted(normalized_pdfs)
         if path not in normalized_mds
     ]
 
@@ -116,13 +128,14 @@ def upload_md(req: UploadRequest):
     output_path = req.pdf_path.replace("raw-data/", "processed-data/markdowns/").replace(".pdf", ".md")
     blob = storage_client.bucket(BUCKET_NAME).blob(output_path)
     blob.upload_from_string(req.markdown, content_type="text/markdown")
+    get_shared_state().delete(LIST_FILES_CACHE_KEY)
     return {"message": f"✅ Markdown uploaded to: {output_path}"}
 
 
 @preprocess_router.get("/list-prompts")
-def list_prompts():
-    prompts = prompt_collection.find({}, {"_id": 1, "subject": 1})
-    return [{"id": str(p["_id"]), "subject": p["subject"]} for p in prompts]
+def list_prompts(request: Request):
+    prompts = prompt_collection.find({}, {"_id": 1, "subject": 1}).sort("_id", 1)
+    return json_response(request, [{"id": str(p["_id"]), "subject": p["subject"]} for p in prompts])
 
 
 
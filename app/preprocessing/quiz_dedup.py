@@ -0,0 +1,265 @@
+import argparse
+import random
+import re
+import unicodedata
+
+import xxhash
+from pymongo import ReplaceOne, UpdateOne
+from utility.mongo_client import db
+
+# Changing any of these invalidates the persisted index; rebuild it with
+# `python -m preprocessing.quiz_dedup` (run from app/) afterwards.
+NUM_PERM = 128
+BANDS = 32
+ROWS = NUM_PERM // BANDS
+SHINGLE_SIZE = 5
+SEED = 1729
+
+# Estimated Jaccard similarity above which two questions count as duplicates
+SIMILARITY_THRESHOLD = 0.8
+# Upper bound on candidates checked per question so lookups stay O(1)
+MAX_CANDIDATES = 50
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_rng = random.Random(SEED)
+_PERMUTATIONS = [
+    (_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME))
+    for _ in range(NUM_PERM)
+]
+
+_LATEX_NOISE = re.compile(r"\\(?:[,;:! ]|quad|qquad|left|right|displaystyle|mathrm|text)|[$~{}]")
+# A single "(a)", "B)", "3." or "iv)" label; "12) apples" or "a.m." are option text
+_LABEL = r"(?:[a-e]|[1-5]|i{1,3}|iv)"
+_OPTION_LABEL = re.compile(rf"^\s*(?:\({_LABEL}\)|{_LABEL}[).](?!\S))\s*", re.IGNORECASE)
+# Whitespace, quotes and sentence punctuation. Digits and maths symbols such as
+# + - = < > ^ / are kept, as they are what tells "2x + 5" from "2x - 5".
+_FORMATTING = re.compile(r"[\s\"'`?!:;,]+|\.(?!\d)")
+_DASHES = str.maketrans({"\u2212": "-", "\u2013": "-", "\u2014": "-"})
+
+quiz_collection = db["quizzes"]
+lsh_collection = db["quizzes_lsh"]
+
+
+def normalize(text) -> str:
+    """Lowercase and strip formatting, LaTeX spacing and whitespace."""
+    text = unicodedata.normalize("NFKC", str(text or "")).lower().translate(_DASHES)
+    text = _LATEX_NOISE.sub(" ", text)
+    return _FORMATTING.sub("", text)
+
+
+def normalize_option(option) -> str:
+    """
+    Normalize an answer option without its "(a)", "B." or "iii)" label.
+
+    >>> normalize_option("A) Paris") == normalize_option("Paris")
+    True
+    >>> normalize_option("(b) $x = -5$") == normalize_option("x = 5")
+    False
+    >>> normalize_option("12) apples"), normalize_option("a.m. time")
+    ('12)apples', 'amtime')
+    """
+    return normalize(_OPTION_LABEL.sub("", str(option or "")))
+
+
+def shingles(quiz: dict) -> set:
+    question = normalize(quiz.get("question"))
+    result = {
+        question[i:i + SHINGLE_SIZE]
+        for i in range(max(len(question) - SHINGLE_SIZE + 1, 1))
+        if question
+    }
+    # Options are whole shingles, so their order does not matter
+    for option in quiz.get("options") or []:
+        option = normalize_option(option)
+        if option:
+            result.add("opt:" + option)
+    return result
+
+
+def signature(quiz: dict):
+    """MinHash signature of a quiz, or None when it has no text to compare."""
+    hashes = [xxhash.xxh64_intdigest(s.encode("utf-8")) for s in shingles(quiz)]
+    if not hashes:
+        return None
+    return [
+        min((a * h + b) % _MERSENNE_PRIME for h in hashes)
+        for a, b in _PERMUTATIONS
+    ]
+
+
+def band_keys(sig: list) -> list:
+    keys = []
+    for band in range(BANDS):
+        rows = sig[band * ROWS:(band + 1) * ROWS]
+        keys.append(f"{band}:{xxhash.xxh3_64_hexdigest(repr(rows).encode())}")
+    return keys
+
+
+def similarity(sig_a: list, sig_b: list) -> float:
+    return sum(a == b for a, b in zip(sig_a, sig_b)) / NUM_PERM
+
+
+class QuizDedupIndex:
+    """
+    MinHash/LSH index over quiz questions, persisted in `quizzes_lsh` next to
+    the `quizzes` collection. Only representatives (questions that matched
+    nothing) are indexed, so `duplicate_of` always points at a canonical
+    question and repeats do not pile up in the same bands. A batch costs one
+    bounded lookup on its band keys, regardless of corpus size.
+    """
+
+    def __init__(self, collection=lsh_collection):
+        self.collection = collection
+        self._indexed = False
+
+    def _ensure_indexes(self):
+        if not self._indexed:
+            self.collection.create_index("bands")
+            self._indexed = True
+
+    def candidates(self, bands: list, limit: int) -> dict:
+        """
+        Fetch up to `limit` indexed entries sharing a band key with `bands` in
+        one query. Returns {band_key: [(quiz_id, signature), ...]}.
+        """
+        self._ensure_indexes()
+        wanted = set(bands)
+        by_band = {}
+        if not wanted:
+            return by_band
+        cursor = self.collection.find({"bands": {"$in": list(wanted)}}, {"bands": 1, "signature": 1})
+        for doc in cursor.limit(limit):
+            for key in wanted.intersection(doc["bands"]):
+                by_band.setdefault(key, []).append((doc["_id"], doc["signature"]))
+        return by_band
+
+    def match_batch(self, quizzes: list) -> list:
+        """
+        Match each quiz (which must already carry its `_id`) against the index
+        and against earlier representatives of the same batch, with a single
+        lookup for the whole batch. Returns one (signature, band_keys, match)
+        tuple per quiz, in input order. Quizzes without any text get a None
+        signature and never match; only entries with a signature and no match
+        should be passed to `add_many`.
+        """
+        signatures = [signature(quiz) for quiz in quizzes]
+        all_bands = [band_keys(sig) if sig else [] for sig in signatures]
+        stored = self.candidates(
+            [key for bands in all_bands for key in bands],
+            limit=MAX_CANDIDATES * len(quizzes),
+        )
+
+        local = {}
+        results = []
+        for quiz, sig, bands in zip(quizzes, signatures, all_bands):
+            if sig is None:
+                results.append((None, [], None))
+                continue
+            candidates = {}
+            for key in bands:
+                for other_id, other_sig in stored.get(key, []):
+                    if len(candidates) >= MAX_CANDIDATES:
+                        break
+                    candidates[other_id] = other_sig
+            for key in bands:
+                candidates.update(local.get(key, []))
+
+            match = None
+            for other_id, other_sig in candidates.items():
+                score = similarity(sig, other_sig)
+                if score >= SIMILARITY_THRESHOLD and (match is None or score > match[1]):
+                    match = (other_id, score)
+            if match is None:
+                for key in bands:
+                    local.setdefault(key, []).append((quiz["_id"], sig))
+            results.append((sig, bands, match))
+        return results
+
+    def add_many(self, entries: list):
+        """Persist (quiz_id, signature, band_keys) entries for stored quizzes."""
+        if not entries:
+            return
+        self._ensure_indexes()
+        self.collection.bulk_write([
+            ReplaceOne({"_id": quiz_id}, {"bands": bands, "signature": sig}, upsert=True)
+            for quiz_id, sig, bands in entries
+        ], ordered=False)
+
+
+dedup_index = QuizDedupIndex()
+
+
+def cluster_collection(apply: bool = False):
+    """
+    Rebuild the LSH index from scratch and group the existing collection into
+    near-duplicate clusters. Questions are visited oldest first; each one
+    either joins the cluster of an earlier representative or becomes a
+    representative itself, and only representatives are indexed. With
+    `apply`, every other member is flagged with `duplicate_of` pointing at its
+    representative, and stale flags on representatives are removed.
+    """
+    quizzes = list(quiz_collection.find({}, {"question": 1, "options": 1, "created_at": 1, "duplicate_of": 1}))
+    quizzes.sort(key=lambda quiz: (quiz.get("created_at") is None, quiz.get("created_at") or 0, str(quiz["_id"])))
+
+    buckets = {}
+    signatures = {}
+    members = {}
+    flagged = set()
+    index_ops = []
+    for quiz in quizzes:
+        quiz_id = quiz["_id"]
+        if quiz.get("duplicate_of") is not None:
+            flagged.add(quiz_id)
+        sig = signature(quiz)
+        if sig is None:
+            continue
+        bands = band_keys(sig)
+
+        candidates = {other for key in bands for other in buckets.get(key, [])[:MAX_CANDIDATES]}
+        best = None
+        for other in candidates:
+            score = similarity(sig, signatures[other])
+            if score >= SIMILARITY_THRESHOLD and (best is None or score > best[1]):
+                best = (other, score)
+        if best:
+            members[best[0]].append(quiz_id)
+            continue
+
+        signatures[quiz_id] = sig
+        members[quiz_id] = [quiz_id]
+        for key in bands:
+            buckets.setdefault(key, []).append(quiz_id)
+        index_ops.append(UpdateOne(
+            {"_id": quiz_id}, {"$set": {"bands": bands, "signature": sig}}, upsert=True
+        ))
+
+    lsh_collection.delete_many({})
+    if index_ops:
+        lsh_collection.bulk_write(index_ops, ordered=False)
+        lsh_collection.create_index("bands")
+
+    clusters = [cluster for cluster in members.values() if len(cluster) > 1]
+
+    if apply:
+        flag_ops = []
+        for representative, *duplicates in clusters:
+            for quiz_id in duplicates:
+                flag_ops.append(UpdateOne({"_id": quiz_id}, {"$set": {"duplicate_of": representative}}))
+        for quiz_id in flagged.intersection(members):
+            flag_ops.append(UpdateOne({"_id": quiz_id}, {"$unset": {"duplicate_of": ""}}))
+        if flag_ops:
+            quiz_collection.bulk_write(flag_ops, ordered=False)
+    return clusters
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cluster near-duplicate questions in the quizzes collection.")
+    parser.add_argument("--apply", action="store_true", help="flag duplicates with `duplicate_of` in MongoDB")
+    args = parser.parse_args()
+
+    clusters = cluster_collection(apply=args.apply)
+    duplicates = sum(len(members) - 1 for members in clusters)
+    print(f"Indexed {lsh_collection.count_documents({})} representative questions")
+    print(f"Found {len(clusters)} near-duplicate clusters covering {duplicates} redundant questions")
+    if args.apply:
+        print("Flagged duplicates with `duplicate_of`")
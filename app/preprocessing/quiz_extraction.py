@@ -1,38 +1,152 @@
-from typing import TypedDict, List
+from typing import List
+from typing_extensions import TypedDict  # pydantic needs this TypedDict to build response schemas on Python < 3.12
 from typing import Any
 from langgraph.graph import StateGraph
 from fastapi import APIRouter, UploadFile, File, Request, Body
 from utility.mongo_client import db
+from utility.http_cache import StaticPage, compressed_stream
+from utility.json_stream import JSONObjectStream
+from preprocessing.quiz_dedup import dedup_index
+from preprocessing.page_classifier import BLANK, TEXT, VISION, classify_page, render_page_image
+from utility.shared_state import get_shared_state, acquire_token
 from uuid import uuid4
 from datetime import datetime
 import hashlib
 import fitz  # PyMuPDF
 from PIL import Image
-import io, json, tempfile, os
+import io, json, tempfile, os, time
 import google.generativeai as genai
 from google.cloud import storage
-from fastapi.responses import HTMLResponse, StreamingResponse
+from fastapi.responses import HTMLResponse
 
 quiz_collection = db["quizzes"]
 storage_client = storage.Client()
 preprocess_quiz_router = APIRouter()
+home_page = StaticPage("extract-quiz.html")
+
+QUIZ_MODEL_NAME = "models/gemini-2.5-flash"
+# Pages with a usable text layer skip the image entirely, so a lighter model is enough
+QUIZ_TEXT_MODEL_NAME = os.getenv("QUIZ_TEXT_MODEL_NAME", "models/gemini-2.5-flash-lite")
+# Per-model request quota shared by all workers; 0 disables rate limiting
+GEMINI_REQUESTS_PER_MINUTE = float(os.getenv("GEMINI_REQUESTS_PER_MINUTE", "0"))
+# Models that accept response_mime_type/response_schema for structured output
+STRUCTURED_OUTPUT_MODELS = {
+	"models/gemini-2.5-flash", "models/gemini-2.5-flash-lite", "models/gemini-2.5-pro", "models/gemini-2.0-flash",
+}
+
+QUIZ_EXTRACTION_PROMPT = (
+    "You are an expert at extracting questions from test papers. "
+    "Analyze the following image of a test paper page and extract all multiple-choice questions "
+    "and their answer options. Return the results as a list of JSON objects. "
+    "The JSON object for each question should have: "
+    " - 'question': the question text "
+    " - 'options': an array of strings for the answer choices "
+    " - 'correct_answer': an array of strings with the correct option(s), if present. "
+    "\n\nLanguage rules: "
+    " - For language subjects (e.g., Hindi, Sanskrit, French, etc.), keep the questions in the original subject language. "
+    " - For all other subjects (e.g., Mathematics, Science, Physics, Chemistry, Biology, etc.), always extract questions in English. "
+    " - If the same question appears in multiple languages, keep only one version (following the above rules). "
+    "\n\nFormatting rules: "
+    " - Always extract any mathematical formulae, equations, or expressions in proper LaTeX format so they can be rendered later. "
+    " - Do not include any text outside the JSON block."
+    "\n\nExample Output:\n"
+    '[{"question": "What is the capital of France?", '
+    '"options": ["London", "Paris", "Berlin", "Delhi"], '
+    '"correct_answer": ["Paris"]}, '
+    '{"question": "Solve for x: $2x + 5 = 15$", '
+    '"options": ["$x = 5$", "$x = 10$", "$x = 2$", "$x = 15$"], '
+    '"correct_answer": ["$x = 5$"]}]'
+)
+
+QUIZ_TEXT_EXTRACTION_PROMPT = QUIZ_EXTRACTION_PROMPT.replace(
+    "Analyze the following image of a test paper page",
+    "Analyze the following text, taken from the text layer of a test paper page "
+    "(line breaks and reading order may be imperfect),",
+)
+PATH_LABELS = {BLANK: "blank/trivial", TEXT: "text layer", VISION: "scanned/vision"}
+
+# LangGraph agent code for extracting quiz questions using Gemini VLM
+class QuizQuestion(TypedDict):
+	question: str
+	options: List[str]
+	correct_answer: List[str]
+
+def generation_config_for(model_name: str):
+	if model_name not in STRUCTURED_OUTPUT_MODELS:
+		return None
+	return genai.GenerationConfig(
+		response_mime_type="application/json",
+		response_schema=list[QuizQuestion],
+	)
+
+def new_quiz_parser(model_name: str) -> JSONObjectStream:
+	# Without a response schema the model writes LaTeX with single backslashes
+	return JSONObjectStream(
+		validate=lambda obj: isinstance(obj, dict) and bool(obj.get("question")),
+		latex_escapes=generation_config_for(model_name) is None,
+	)
+
+def _chunk_text(chunk) -> str:
+	# Chunks without text parts (e.g. the final finish/usage chunk) raise on .text
+	try:
+		return chunk.text
+	except ValueError:
+		return ""
+
+def stream_quiz_questions(model, contents, parser: JSONObjectStream):
+	"""
+	Stream a Gemini response and yield quiz questions as each one completes.
+	"""
+	if GEMINI_REQUESTS_PER_MINUTE:
+		acquire_token(
+			get_shared_state(),
+			f"gemini:{model.model_name}",
+			rate=GEMINI_REQUESTS_PER_MINUTE / 60,
+			capacity=GEMINI_REQUESTS_PER_MINUTE,
+		)
+	response = model.generate_content(
+		contents,
+		generation_config=generation_config_for(model.model_name),
+		stream=True,
+	)
+	for chunk in response:
+		yield from parser.feed(_chunk_text(chunk))
 
 @preprocess_quiz_router.get("/", response_class=HTMLResponse)
-async def extract_quiz_home():
-	html_path = os.path.join(os.path.dirname(__file__), "../static", "extract-quiz.html")
-	with open(html_path, encoding="utf-8") as f:
-		content = f.read()
-	return HTMLResponse(content=content, status_code=200)
+async def extract_quiz_home(request: Request):
+	return home_page.response(request)
 
 @preprocess_quiz_router.post("/upload-to-db")
-async def upload_quiz_to_db(quizzes: list = Body(...)):
-	# Insert quizzes into MongoDB collection
+def upload_quiz_to_db(quizzes: list = Body(...), on_duplicate: str = "flag"):
+	# Insert quizzes into MongoDB collection. Near-duplicates of stored questions are either
+	# inserted with a `duplicate_of` flag ("flag") or not inserted at all ("merge").
+	# A plain def so FastAPI runs the blocking MongoDB calls in its threadpool.
 	if not quizzes or not isinstance(quizzes, list):
 		return {"success": False, "message": "No quiz data provided."}
+	if on_duplicate not in ("flag", "merge"):
+		return {"success": False, "message": "on_duplicate must be 'flag' or 'merge'."}
 	try:
 		quizzes = [{**quiz, "_id": str(uuid4()), "created_at": datetime.now()} for quiz in quizzes]
-		result = quiz_collection.insert_many(quizzes)
-		return {"success": True, "inserted_ids": [str(_id) for _id in result.inserted_ids]}
+		matches = dedup_index.match_batch(quizzes)
+		to_insert, index_entries, duplicates = [], [], []
+		for position, (quiz, (sig, bands, match)) in enumerate(zip(quizzes, matches)):
+			if match:
+				duplicate_of, score = match
+				duplicates.append({"index": position, "duplicate_of": duplicate_of, "similarity": score})
+				if on_duplicate == "merge":
+					continue
+				quiz["duplicate_of"] = duplicate_of
+			to_insert.append(quiz)
+			# Only representatives are indexed, so `duplicate_of` always names the original
+			if not match and sig is not None:
+				index_entries.append((quiz["_id"], sig, bands))
+
+		inserted_ids = []
+		if to_insert:
+			result = quiz_collection.insert_many(to_insert)
+			inserted_ids = [str(_id) for _id in result.inserted_ids]
+			dedup_index.add_many(index_entries)
+		return {"success": True, "inserted_ids": inserted_ids, "duplicates": duplicates}
 		
 	except Exception as e:
 		return {"success": False, "message": str(e)}
@@ -49,50 +163,62 @@ async def extract_quiz_endpoint(request: Request, pdf: UploadFile = File(...)):
 	google_api_key = os.getenv("GOOGLE_API_KEY")
 
 	def stream_quiz_extraction():
-		images = extract_pdf_page_images(tmp_path)
 		genai.configure(api_key=google_api_key)
+		models = {
+			TEXT: genai.GenerativeModel(QUIZ_TEXT_MODEL_NAME),
+			VISION: genai.GenerativeModel(QUIZ_MODEL_NAME),
+		}
+		stats = {path: {"pages": 0, "questions": 0, "seconds": 0.0} for path in PATH_LABELS}
 		quiz_questions = []
-		for page_number, image in enumerate(images):
-			yield f"Processing page {page_number + 1}...\n"
+		try:
+			doc = fitz.open(tmp_path)
+		except Exception as e:
+			yield f"Error opening PDF: {e}\n"
+			yield json.dumps(quiz_questions)
+			return
+
+		for page_number, page in enumerate(doc):
+			started = time.perf_counter()
+			# Blank pages are skipped, born-digital pages use their text layer, scans are rendered
+			path, text = classify_page(page)
+			stats[path]["pages"] += 1
+			if path == BLANK:
+				yield f"Skipping page {page_number + 1} ({PATH_LABELS[path]})\n"
+				stats[path]["seconds"] += time.perf_counter() - started
+				continue
+
+			yield f"Processing page {page_number + 1} ({PATH_LABELS[path]})...\n"
+			if path == TEXT:
+				contents = [QUIZ_TEXT_EXTRACTION_PROMPT, f"Page text:\n{text}"]
+			else:
+				contents = [QUIZ_EXTRACTION_PROMPT, render_page_image(page)]
+			parser = new_quiz_parser(models[path].model_name)
 			try:
-				model = genai.GenerativeModel('models/gemini-2.5-flash')
-				prompt = (
-    "You are an expert at extracting questions from test papers. "
-    "Analyze the following image of a test paper page and extract all multiple-choice questions "
-    "and their answer options. Return the results as a list of JSON objects. "
-    "The JSON object for each question should have: "
-    " - 'question': the question text "
-    " - 'options': an array of strings for the answer choices "
-    " - 'correct_answer': an array of strings with the correct option(s), if present. "
-    "\n\nLanguage rules: "
-    " - For language subjects (e.g., Hindi, Sanskrit, French, etc.), keep the questions in the original subject language. "
-    " - For all other subjects (e.g., Mathematics, Science, Physics, Chemistry, Biology, etc.), always extract questions in English. "
-    " - If the same question appears in multiple languages, keep only one version (following the above rules). "
-    "\n\nFormatting rules: "
-    " - Always extract any mathematical formulae, equations, or expressions in proper LaTeX format so they can be rendered later. "
-    " - Do not include any text outside the JSON block."
-    "\n\nExample Output:\n"
-    '[{"question": "What is the capital of France?", '
-    '"options": ["London", "Paris", "Berlin", "Delhi"], '
-    '"correct_answer": ["Paris"]}, '
-    '{"question": "Solve for x: $2x + 5 = 15$", '
-    '"options": ["$x = 5$", "$x = 10$", "$x = 2$", "$x = 15$"], '
-    '"correct_answer": ["$x = 5$"]}]'
-)
-				response = model.generate_content([prompt, image])
-				response.resolve()
-				json_str = response.text.strip().replace("```json", "").replace("```", "")
-				extracted_data = json.loads(json_str)
-				print(f"✅ Extracted {len(extracted_data)} questions from page {page_number + 1}")
+				# Each question is sent as its own JSON line as soon as it is complete
+				for question in stream_quiz_questions(models[path], contents, parser):
+					quiz_questions.append(question)
+					yield json.dumps(question) + "\n"
 			except Exception as e:
 				yield f"Error during Gemini API call for page {page_number + 1}: {e}\n"
 				print(f"❌ Error during Gemini API call for page {page_number + 1}: {e}")
-				extracted_data = []
-			quiz_questions.extend(extracted_data)
-			# print(f"quiz questions : {quiz_questions}")
+			dropped = parser.close()
+			if dropped:
+				yield f"Dropped {dropped} malformed question(s) on page {page_number + 1}\n"
+			elapsed = time.perf_counter() - started
+			stats[path]["questions"] += parser.emitted
+			stats[path]["seconds"] += elapsed
+			print(f"✅ Extracted {parser.emitted} questions from page {page_number + 1} via {path} in {elapsed:.1f}s")
+		doc.close()
+
+		for path, label in PATH_LABELS.items():
+			path_stats = stats[path]
+			yield (
+				f"Summary - {label}: {path_stats['pages']} page(s), "
+				f"{path_stats['questions']} question(s), {path_stats['seconds']:.1f}s\n"
+			)
 		yield json.dumps(quiz_questions)
 
-	return StreamingResponse(stream_quiz_extraction(), media_type="text/plain")
+	return compressed_stream(request, stream_quiz_extraction(), media_type="text/plain")
 
 # endpoint to upload image on cloud storage and return the public url
 @preprocess_quiz_router.post("/upload-image")
@@ -128,29 +254,19 @@ def extract_pdf_page_images(pdf_path: str) -> List[Image.Image]:
 	try:
 		doc = fitz.open(pdf_path)
 		for page_num in range(len(doc)):
-			page = doc.load_page(page_num)
-			pix = page.get_pixmap(dpi=300)  # Render at 300 DPI
-			img_bytes = pix.tobytes("png")
-			image = Image.open(io.BytesIO(img_bytes))
-			images.append(image)
+			images.append(render_page_image(doc.load_page(page_num)))  # Render at 300 DPI
 		doc.close()
 	except Exception as e:
 		print(f"Error extracting images from PDF: {e}")
 	return images
 
-# LangGraph agent code for extracting quiz questions using Gemini VLM
-class QuizQuestion(TypedDict):
-	question: str
-	options: List[str]
-	correct_answer: List[str]
-
 def extract_quiz_from_pdf(pdf_path: str, gemini_api_key: str) -> List[QuizQuestion]:
 	images = extract_pdf_page_images(pdf_path)
 	genai.configure(api_key=gemini_api_key)
 	quiz_questions = []
 	for page_number, image in enumerate(images):
 		try:
-			model = genai.GenerativeModel('models/gemini-2.5-flash')
+			model = genai.GenerativeModel(QUIZ_MODEL_NAME)
 			prompt = (
 				"You are an expert at extracting questions from test papers. "
 				"Analyze the following image of a test paper page and extract all multiple-choice questions "
@@ -164,13 +280,10 @@ def extract_quiz_from_pdf(pdf_path: str, gemini_api_key: str) -> List[QuizQuesti
 			image.save(buf, format='PNG')
 			buf.seek(0)
 			image_bytes = buf.read()
-			response = model.generate_content([prompt, image_bytes])
-			response.resolve()
-			# Clean up the response to get a valid JSON string
-			json_str = response.text.strip().replace("```json", "").replace("```", "")
-			extracted_data = json.loads(json_str)
+			parser = new_quiz_parser(model.model_name)
+			# Questions parsed before an error are kept, only the malformed rest is lost
+			for question in stream_quiz_questions(model, [prompt, image_bytes], parser):
+				quiz_questions.append(question)
 		except Exception as e:
 			print(f"❌ Error during Gemini API call for page {page_number + 1}: {e}")
-			extracted_data = [] # Return an empty list if there's an error
-		quiz_questions.extend(extracted_data)
 	return quiz_questions
\ No newline at end of file
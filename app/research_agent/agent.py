@@ -1,11 +1,18 @@
-from fastapi import APIRouter, UploadFile, Form
+from fastapi import APIRouter, UploadFile, Form, Request
 from fastapi.responses import HTMLResponse, StreamingResponse, JSONResponse
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from .research_main import build_research_agent, initial_state
+from .runs import runs, start_run, iter_events, iter_remote_events, format_sse, get_run_record
+from utility.http_cache import StaticPage, compress
 import pymupdf as fitz
-import asyncio, re, os
+from typing import Optional
+import asyncio
+import os
+
+RESEARCH_OUTPUT_DIR = "./research_outputs"
 
 agent_router = APIRouter()
+home_page = StaticPage("research-agent.html")
 
 def extract_chunks_from_pdf(file_bytes: bytes) :
     doc = fitz.open(stream=file_bytes, filetype="pdf")
@@ -15,73 +22,74 @@ def extract_chunks_from_pdf(file_bytes: bytes) :
     return chunks
 
 @agent_router.get("/", response_class=HTMLResponse)
-async def home():
-    html_path = os.path.join(os.path.dirname(__file__), "..", "static", "research-agent.html")
-    with open(html_path, encoding="utf-8") as f:
-        content = f.read()
-    return HTMLResponse(content=content, status_code=200)
+async def home(request: Request):
+    return home_page.response(request)
 
+# Handlers below are plain defs where they block on PDF parsing, MongoDB or disk,
+# so FastAPI runs them in its threadpool instead of on the event loop
 @agent_router.post("/process-research")
-async def process_research(
+def process_research(
     file: UploadFile,
     objective: str = Form(...),
+    top_k: Optional[int] = Form(None),
+    min_score: Optional[float] = Form(None),
 ):
-    file_bytes = await file.read()
+    if top_k is not None and top_k < 1:
+        return JSONResponse(status_code=400, content={"error": "top_k must be at least 1"})
+    if min_score is not None and not 0 <= min_score <= 1:
+        return JSONResponse(status_code=400, content={"error": "min_score must be between 0 and 1"})
+
+    file_bytes = file.file.read()
     chunks = extract_chunks_from_pdf(file_bytes)
-    state = initial_state(objective=objective, chunks=chunks)
-    agent = build_research_agent()
+    state = initial_state(objective=objective, chunks=chunks, top_k=top_k, min_score=min_score)
+    agent = build_research_agent(prefilter=top_k is not None or min_score is not None)
+
+    # The run outlives this request; clients follow it through /runs/{run_id}/events
+    run = start_run(agent, state, objective, file.filename)
+    return JSONResponse(content=run.summary(), status_code=202)
+
+@agent_router.get("/runs/{run_id}")
+def get_run(run_id: str):
+    record = get_run_record(run_id)
+    if not record:
+        return JSONResponse(status_code=404, content={"error": "Run not found"})
+    text = record.pop("text")
+    return JSONResponse(content={**record, "result": text if record["status"] != "running" else None})
+
+@agent_router.get("/runs/{run_id}/events")
+async def run_events(run_id: str, request: Request, last_event_id: Optional[int] = None):
+    run = runs.get(run_id)
+    if not run and not await asyncio.to_thread(get_run_record, run_id):
+        return JSONResponse(status_code=404, content={"error": "Run not found"})
+
+    # EventSource sends Last-Event-ID on reconnect; the query param covers manual resumes
+    header = request.headers.get("last-event-id", "")
+    if header.isdigit():
+        last_event_id = int(header)
+
+    # Runs executing in another worker are followed through shared state
+    events = iter_events(run, last_event_id or 0) if run else iter_remote_events(run_id, last_event_id or 0)
 
     async def generate():
-        last_node = None
-        yield f"\n🧠 Objective: {objective}\n"
-
-        for chunk, metadata in agent.stream(state, stream_mode="messages"):
-            current_node = metadata.get("langgraph_node")
-            state_data = metadata.get("state", {})
-
-            if current_node != last_node:
-                if current_node == "DEFINE":
-                    yield f"\n##🔍 Objective Definition:\n"
-                    content = state_data.get("objective_definition", "")
-                elif current_node == "PLAN":
-                    yield f"\n##📝 Research Plan:\n"
-                    content = state_data.get("plan", "")
-                elif current_node == "GATHER":
-                    idx = state_data.get("current_chunk_index", 0) + 1
-                    total = len(chunks)
-                    gathered = state_data.get("gathered", [""])
-                    yield f"\n##📚 Insights from Chunk {idx}/{total}:\n"
-                    content = gathered[-1]
-                elif current_node == "REFINE":
-                    yield f"\n##🔧 Refined Research Notes:\n"
-                    content = state_data.get("refined", "")
-                elif current_node == "GENERATE":
-                    yield f"\n##📄 Final Report:\n"
-                    content = state_data.get("final_output", "")
-                else:
-                    content = chunk.content
-            else:
-                content = chunk.content
-
-            # Simulate streaming chunk by chunk
-            tokens = re.split(r'(\s+)', content)  # splits but keeps spaces & newlines
-
-            for token in tokens:
-                yield token
-                await asyncio.sleep(0.03)  # Simulate a small delay for streaming effect
-
-            last_node = current_node
-
-    return StreamingResponse(generate(), media_type="text/plain")
+        async for entry in events:
+            yield format_sse(entry) if entry else ": keep-alive\n\n"
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return StreamingResponse(generate(), media_type="text/event-stream", headers=headers)
 
 @agent_router.post("/save-research")
-async def save_research(
-    file: UploadFile,
-    response_text: str = Form(...),
-):
-    filename = file.filename.replace(".pdf", "_research.txt")
-    with open(f"./research_outputs/{filename}", "w") as f:
-        f.write(response_text)
+def save_research(run_id: str = Form(...)):
+    record = get_run_record(run_id)
+    if not record:
+        return JSONResponse(status_code=404, content={"error": "Run not found"})
+    if record["status"] != "done":
+        return JSONResponse(status_code=409, content={"error": f"Run is {record['status']}, nothing to save yet"})
+
+    base = os.path.basename(record["filename"] or run_id).replace(".pdf", "")
+    filename = f"{base}_research.txt.zst"
+    os.makedirs(RESEARCH_OUTPUT_DIR, exist_ok=True)
+    with open(os.path.join(RESEARCH_OUTPUT_DIR, filename), "wb") as f:
+        f.write(compress(record["text"].encode("utf-8"), "zstd", level=19))
 
     return JSONResponse(content={"message": f"Research saved successfully as {filename}."}, status_code=200)
 
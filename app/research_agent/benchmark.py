@@ -0,0 +1,73 @@
+"""
+Compare research runs with and without the BM25 relevance prefilter.
+
+Usage (from app/):
+    python -m research_agent.benchmark book.pdf "Objective text" --top-k 5
+"""
+import argparse
+import time
+
+from langchain_core.callbacks import BaseCallbackHandler
+from .agent import extract_chunks_from_pdf
+from .research_main import build_research_agent, initial_state, run_config
+
+
+class LLMCallCounter(BaseCallbackHandler):
+    def __init__(self):
+        self.calls = 0
+
+    def on_chat_model_start(self, serialized, messages, **kwargs):
+        self.calls += 1
+
+    def on_llm_start(self, serialized, prompts, **kwargs):
+        self.calls += 1
+
+
+def run(chunks, objective, top_k=None, min_score=None):
+    prefilter = top_k is not None or min_score is not None
+    agent = build_research_agent(prefilter=prefilter)
+    state = initial_state(objective=objective, chunks=chunks, top_k=top_k, min_score=min_score)
+    counter = LLMCallCounter()
+    config = run_config(state, callbacks=[counter])
+
+    start = time.perf_counter()
+    result = agent.invoke(state, config=config)
+    elapsed = time.perf_counter() - start
+    return {
+        "seconds": elapsed,
+        "llm_calls": counter.calls,
+        "gathered_chunks": len(result["gathered"]),
+        "skipped_chunks": result.get("skipped_chunks", 0),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pdf")
+    parser.add_argument("objective")
+    parser.add_argument("--top-k", type=int, default=None)
+    parser.add_argument("--min-score", type=float, default=None)
+    args = parser.parse_args()
+    if args.top_k is None and args.min_score is None:
+        args.top_k = 5
+    if args.top_k is not None and args.top_k < 1:
+        parser.error("--top-k must be at least 1")
+    if args.min_score is not None and not 0 <= args.min_score <= 1:
+        parser.error("--min-score must be between 0 and 1")
+
+    with open(args.pdf, "rb") as f:
+        chunks = extract_chunks_from_pdf(f.read())
+    print(f"{len(chunks)} chunks extracted from {args.pdf}")
+
+    baseline = run(chunks, args.objective)
+    filtered = run(chunks, args.objective, top_k=args.top_k, min_score=args.min_score)
+
+    print(f"{'':<12}{'seconds':>10}{'llm calls':>12}{'gathered':>10}{'skipped':>10}")
+    for name, stats in (("no filter", baseline), ("bm25 filter", filtered)):
+        print(
+            f"{name:<12}{stats['seconds']:>10.1f}{stats['llm_calls']:>12}"
+            f"{stats['gathered_chunks']:>10}{stats['skipped_chunks']:>10}"
+        )
+    if filtered["seconds"]:
+        print(f"Speed-up: {baseline['seconds'] / filtered['seconds']:.2f}x, "
+              f"{baseline['llm_calls'] - filtered['llm_calls']} fewer LLM calls")
@@ -2,7 +2,8 @@ from langgraph.graph import StateGraph, END
 from langchain_core.runnables import RunnableLambda, RunnableConfig
 from langchain_core.messages import HumanMessage
 from langchain_google_genai import ChatGoogleGenerativeAI
-from typing import TypedDict
+from typing import TypedDict, Optional
+from .retrieval import select_chunks
 
 llm = ChatGoogleGenerativeAI(
     model="gemini-2.0-flash-lite",
@@ -20,9 +21,12 @@ class AgentState(TypedDict):
     final_output: str
     objective_definition: str
     plan: str
+    top_k: Optional[int]
+    min_score: Optional[float]
+    skipped_chunks: int
 
 # State Schema
-def initial_state(objective, chunks):
+def initial_state(objective, chunks, top_k=None, min_score=None):
     return AgentState(
         objective=objective,
         doc_chunks=chunks,
@@ -31,9 +35,16 @@ def initial_state(objective, chunks):
         refined="",
         final_output="",
         objective_definition="",
-        plan=""
+        plan="",
+        top_k=top_k,
+        min_score=min_score,
+        skipped_chunks=0
     )
 
+def run_config(state, **config):
+    # GATHER loops once per chunk, which can exceed LangGraph's default limit of 25
+    return {**config, "recursion_limit": len(state["doc_chunks"]) + 20}
+
 # DEFINE Node
 def define_fn(state):
     objective = state["objective"]
@@ -50,6 +61,18 @@ def plan_fn(state):
     )
     return {**state, "plan": response.content}
 
+# FILTER Node (optional): rank chunks locally with BM25 so GATHER only sees relevant ones
+def prefilter_fn(state):
+    chunks = state["doc_chunks"]
+    # The objective is repeated so its terms weigh more than the generic plan wording
+    query = "\n".join([state["objective"], state["objective"], state["objective_definition"], state["plan"]])
+    keep = select_chunks(chunks, query, top_k=state["top_k"], min_score=state["min_score"])
+    return {
+        **state,
+        "doc_chunks": [chunks[i] for i in keep],
+        "skipped_chunks": len(chunks) - len(keep),
+    }
+
 # GATHER Node
 def gather_fn(state):
     idx = state["current_chunk_index"]
@@ -103,7 +126,7 @@ def generate_fn(state):
     return {**state, "final_output": result.content}
 
 # === LangGraph Build ===
-def build_research_agent():
+def build_research_agent(prefilter=False):
     workflow = StateGraph(AgentState)
 
     workflow.add_node("DEFINE", RunnableLambda(define_fn))
@@ -114,7 +137,12 @@ def build_research_agent():
 
     workflow.set_entry_point("DEFINE")
     workflow.add_edge("DEFINE", "PLAN")
-    workflow.add_edge("PLAN", "GATHER")
+    if prefilter:
+        workflow.add_node("FILTER", RunnableLambda(prefilter_fn))
+        workflow.add_edge("PLAN", "FILTER")
+        workflow.add_edge("FILTER", "GATHER")
+    else:
+        workflow.add_edge("PLAN", "GATHER")
 
     # Loop GATHER until all chunks processed
     workflow.add_conditional_edges("GATHER", should_continue_gathering, {
@@ -0,0 +1,77 @@
+import math
+import re
+from collections import Counter
+
+TOKEN = re.compile(r"\w+", re.UNICODE)
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "has", "have",
+    "in", "is", "it", "its", "of", "on", "or", "that", "the", "this", "to", "was",
+    "were", "will", "with", "what", "which", "who", "how", "why", "can", "into",
+}
+
+
+def tokenize(text: str) -> list:
+    return [t for t in TOKEN.findall(text.lower()) if len(t) > 1 and t not in STOPWORDS]
+
+
+class BM25Index:
+    """In-process Okapi BM25 over a list of documents, backed by an inverted index."""
+
+    def __init__(self, documents: list, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings = {}
+        self.doc_lengths = []
+        for doc_id, text in enumerate(documents):
+            counts = Counter(tokenize(text))
+            self.doc_lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                self.postings.setdefault(term, []).append((doc_id, tf))
+        self.avgdl = (sum(self.doc_lengths) / len(self.doc_lengths)) if self.doc_lengths else 0.0
+
+    def idf(self, term: str) -> float:
+        n = len(self.postings.get(term, ()))
+        N = len(self.doc_lengths)
+        return math.log(1 + (N - n + 0.5) / (n + 0.5))
+
+    def score(self, query: str) -> list:
+        scores = [0.0] * len(self.doc_lengths)
+        if not self.avgdl:
+            return scores
+        for term, qtf in Counter(tokenize(query)).items():
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            # Dampen terms repeated across the objective and plan
+            weight = self.idf(term) * (1 + math.log(qtf))
+            for doc_id, tf in postings:
+                length_norm = 1 - self.b + self.b * self.doc_lengths[doc_id] / self.avgdl
+                scores[doc_id] += weight * tf * (self.k1 + 1) / (tf + self.k1 * length_norm)
+        return scores
+
+
+def select_chunks(chunks: list, query: str, top_k=None, min_score=None) -> list:
+    """
+    Return indices (in document order) of the chunks relevant to `query`.
+
+    `top_k` keeps at most that many of the best-scoring chunks; `min_score`
+    keeps chunks scoring at least that fraction (0-1) of the best chunk. Chunks
+    sharing no term with the query are always skipped, unless none match at
+    all, in which case every chunk is kept.
+    """
+    if top_k is not None and top_k < 1:
+        raise ValueError("top_k must be at least 1")
+    if min_score is not None and not 0 <= min_score <= 1:
+        raise ValueError("min_score must be between 0 and 1")
+
+    scores = BM25Index(chunks).score(query)
+    if not any(scores):
+        return list(range(len(chunks)))
+
+    ranked = sorted((i for i in range(len(chunks)) if scores[i] > 0), key=lambda i: scores[i], reverse=True)
+    best = scores[ranked[0]]
+    if min_score is not None:
+        ranked = [i for i in ranked if scores[i] >= min_score * best]
+    if top_k is not None:
+        ranked = ranked[:top_k]
+    return sorted(ranked)
@@ -0,0 +1,278 @@
+import asyncio
+import json
+import threading
+import time
+from collections import deque
+from uuid import uuid4
+from utility.shared_state import get_shared_state
+from .research_main import run_config
+
+# Oldest events are dropped past this; the full text is still kept on the run
+MAX_EVENTS = 5000
+# Finished runs stay attachable for this long
+RUN_TTL_SECONDS = 3600
+# Idle SSE connections get a comment this often so proxies keep them open
+KEEPALIVE_SECONDS = 15
+# How often a running job pushes its text to shared state, and other workers poll it
+PUBLISH_INTERVAL_SECONDS = 1.0
+
+NODE_TITLES = {
+    "DEFINE": "🔍 Objective Definition",
+    "PLAN": "📝 Research Plan",
+    "FILTER": "🔎 Relevance Filter",
+    "GATHER": "📚 Insights from Chunk",
+    "REFINE": "🔧 Refined Research Notes",
+    "GENERATE": "📄 Final Report",
+}
+
+
+class EventLog:
+    """
+    Append-only, bounded log of (id, event, data) entries with increasing ids.
+    Appends come from the worker thread; readers wait on a future that is
+    resolved on their own event loop through `call_soon_threadsafe`.
+    """
+
+    def __init__(self, maxlen=MAX_EVENTS):
+        self.entries = deque(maxlen=maxlen)
+        self.last_id = 0
+        self.lock = threading.Lock()
+        self.waiters = []
+
+    def append(self, event_id: int, event: str, data: dict):
+        with self.lock:
+            self.entries.append((event_id, event, data))
+            self.last_id = event_id
+            waiters, self.waiters = self.waiters, []
+        for loop, future in waiters:
+            try:
+                loop.call_soon_threadsafe(_wake, future)
+            except RuntimeError:
+                pass  # the reader's loop has shut down
+
+    def after(self, last_id: int) -> list:
+        with self.lock:
+            return [entry for entry in self.entries if entry[0] > last_id]
+
+    async def wait(self, last_id: int, timeout: float) -> bool:
+        """Wait until an entry newer than `last_id` exists; False on timeout."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        waiter = (loop, future)
+        with self.lock:
+            if self.last_id > last_id:
+                return True
+            self.waiters.append(waiter)
+        try:
+            await asyncio.wait_for(future, timeout=timeout)
+            return True
+        except asyncio.TimeoutError:
+            with self.lock:
+                if waiter in self.waiters:
+                    self.waiters.remove(waiter)
+            return False
+
+
+def _wake(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class ResearchRun:
+    def __init__(self, agent, state, objective, filename):
+        self.id = uuid4().hex
+        self.agent = agent
+        self.state = state
+        self.objective = objective
+        self.filename = filename
+        self.status = "running"
+        self.error = None
+        self.text = []
+        self.length = 0
+        self.created_at = time.time()
+        self.finished_at = None
+        self.log = EventLog()
+        self._published_at = 0.0
+
+    @property
+    def finished(self) -> bool:
+        # Set only once the final "end" event is in the log
+        return self.finished_at is not None
+
+    def emit(self, event: str, **data):
+        # Event ids are offsets into the run's text, so a Last-Event-ID means the
+        # same thing here and on workers replaying the published text. "end" is
+        # the only event without text and takes the offset after the last one.
+        text = data.get("text")
+        if text:
+            self.text.append(text)
+            self.length += len(text)
+            event_id = self.length
+        else:
+            event_id = self.length + 1
+        self.log.append(event_id, event, data)
+        self.publish(force=event == "node")
+
+    def publish(self, force: bool = False):
+        """Push status and text to shared state so any worker can serve this run."""
+        now = time.monotonic()
+        if not force and now - self._published_at < PUBLISH_INTERVAL_SECONDS:
+            return
+        self._published_at = now
+        try:
+            get_shared_state().put_job(self.id, self.record(), ttl=RUN_TTL_SECONDS)
+        except Exception as e:
+            print(f"❌ Could not publish research run {self.id}: {e}")
+
+    def execute(self):
+        try:
+            self._stream()
+            self.status = "done"
+        except Exception as e:
+            self.error = str(e)
+            self.status = "error"
+        self.emit("end", status=self.status, error=self.error)
+        self.finished_at = time.time()
+        self.publish(force=True)
+
+    def _stream(self):
+        total = len(self.state["doc_chunks"])
+        gathered = 0
+        last_node = None
+        last_message_id = None
+        self.emit("token", text=f"\n🧠 Objective: {self.objective}\n")
+
+        for mode, payload in self.agent.stream(self.state, run_config(self.state), stream_mode=["updates", "messages"]):
+            if mode == "updates":
+                # FILTER makes no LLM call, so it only shows up as a state update
+                if "FILTER" in payload:
+                    total = len(payload["FILTER"]["doc_chunks"])
+                    skipped = payload["FILTER"]["skipped_chunks"]
+                    self.emit("node", node="FILTER", text=f"\n##{NODE_TITLES['FILTER']}:\n")
+                    self.emit("token", text=(
+                        f"Sending {total} of {total + skipped} chunks to the model, "
+                        f"skipped {skipped} irrelevant chunks.\n"
+                    ))
+                continue
+
+            chunk, metadata = payload
+            current_node = metadata.get("langgraph_node")
+            if current_node == "GATHER" and (current_node != last_node or chunk.id != last_message_id):
+                # GATHER loops on itself, one LLM message per document chunk
+                gathered += 1
+                self.emit("node", node=current_node, text=f"\n##{NODE_TITLES['GATHER']} {gathered}/{total}:\n")
+            elif current_node != last_node and current_node in NODE_TITLES:
+                self.emit("node", node=current_node, text=f"\n##{NODE_TITLES[current_node]}:\n")
+            if chunk.content:
+                self.emit("token", node=current_node, text=chunk.content)
+            last_node = current_node
+            last_message_id = chunk.id
+
+    def result(self) -> str:
+        return "".join(self.text)
+
+    def summary(self) -> dict:
+        return {
+            "run_id": self.id,
+            # Only report the final status once "end" is logged and published
+            "status": self.status if self.finished else "running",
+            "error": self.error,
+            "objective": self.objective,
+            "filename": self.filename,
+            "length": self.length,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+    def record(self) -> dict:
+        return {**self.summary(), "text": self.result()}
+
+
+runs = {}
+
+
+def prune_runs():
+    now = time.time()
+    for run_id, run in list(runs.items()):
+        if run.finished and now - run.finished_at > RUN_TTL_SECONDS:
+            runs.pop(run_id, None)
+
+
+def start_run(agent, state, objective, filename) -> ResearchRun:
+    """Run the agent on a background thread, detached from any HTTP response."""
+    prune_runs()
+    run = ResearchRun(agent, state, objective, filename)
+    runs[run.id] = run
+    run.publish(force=True)
+    threading.Thread(target=run.execute, name=f"research-{run.id}", daemon=True).start()
+    return run
+
+
+def get_run_record(run_id: str):
+    """Summary plus text of a run, whether it executes in this worker or another."""
+    run = runs.get(run_id)
+    if run:
+        return run.record()
+    return get_shared_state().get_job(run_id)
+
+
+def format_sse(entry) -> str:
+    event_id, event, data = entry
+    return f"id: {event_id}\nevent: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def iter_events(run: ResearchRun, last_event_id: int = 0):
+    """
+    Replay events after `last_event_id`, then follow the log until the run
+    ends. Text older than the bounded log is replayed as a single token.
+    Yields None when idle for KEEPALIVE_SECONDS.
+    """
+    while True:
+        entries = run.log.after(last_event_id)
+        for entry in entries:
+            event_id, event, data = entry
+            start = event_id - len(data["text"]) if data.get("text") else event_id - 1
+            if start > last_event_id:
+                # The log dropped older entries; the run still has their text
+                yield (start, "token", {"text": run.result()[last_event_id:start]})
+            elif start < last_event_id and data.get("text"):
+                # Resuming mid-entry, e.g. with an id from a worker replaying published text
+                entry = (event_id, event, {**data, "text": data["text"][last_event_id - start:]})
+            yield entry
+            last_event_id = entry[0]
+            if entry[1] == "end":
+                return
+        if entries:
+            continue
+        # `finished` is only set after "end" is logged, so nothing more is coming
+        if run.finished and not run.log.after(last_event_id):
+            return
+        if not await run.log.wait(last_event_id, KEEPALIVE_SECONDS):
+            yield None
+
+
+async def iter_remote_events(run_id: str, last_event_id: int = 0):
+    """
+    Follow a run executing in another worker by polling its published text.
+    Yields the same offset-based ids as iter_events, so clients can resume
+    against either worker.
+    """
+    state = get_shared_state()
+    idle = 0.0
+    while True:
+        job = await asyncio.to_thread(state.get_job, run_id)
+        if job is None or last_event_id > len(job["text"]):
+            return
+        text = job["text"]
+        if len(text) > last_event_id:
+            yield (len(text), "token", {"text": text[last_event_id:]})
+            last_event_id = len(text)
+            idle = 0.0
+        if job["status"] != "running":
+            yield (len(text) + 1, "end", {"status": job["status"], "error": job["error"]})
+            return
+        await asyncio.sleep(PUBLISH_INTERVAL_SECONDS)
+        idle += PUBLISH_INTERVAL_SECONDS
+        if idle >= KEEPALIVE_SECONDS:
+            idle = 0.0
+            yield None
@@ -4,6 +4,7 @@ from pymongo import MongoClient
 from pydantic import BaseModel
 import os
 from utility.mongo_client import db
+from utility.http_cache import StaticPage, json_response
 
 app = FastAPI()
 
@@ -14,20 +15,18 @@ class PromptUpdate(BaseModel):
     prompt: str
 
 settings_router = APIRouter()
+home_page = StaticPage("settings.html")
 
 @settings_router.get("/", response_class=HTMLResponse)
-async def home():
-    html_path = os.path.join(os.path.dirname(__file__), ".." , "static", "settings.html")
-    with open(html_path, encoding="utf-8") as f:
-        content = f.read()
-    return HTMLResponse(content=content, status_code=200)
+async def home(request: Request):
+    return home_page.response(request)
 
 @settings_router.get("/prompts")
-async def get_prompts():
+async def get_prompts(request: Request):
     prompts = {}
-    for doc in collection.find():
+    for doc in collection.find().sort("subject", 1):
         prompts[doc["subject"]] = doc["prompt"]
-    return JSONResponse(content={"prompts": prompts})
+    return json_response(request, {"prompts": prompts})
 
 @settings_router.post("/prompts/update")
 async def update_prompt(data: PromptUpdate):
@@ -0,0 +1,140 @@
+import gzip
+import json
+import os
+import zlib
+
+import xxhash
+import zstandard
+from fastapi import Request
+from fastapi.responses import Response, StreamingResponse
+
+STATIC_DIR = os.path.join(os.path.dirname(__file__), "..", "static")
+
+# Bodies smaller than this are cheaper to send as-is than to compress
+MIN_COMPRESS_SIZE = 512
+
+# Preferred order when the client accepts several encodings
+SUPPORTED_ENCODINGS = ("zstd", "gzip")
+ETAG_SUFFIX = {None: "", "gzip": "-gz", "zstd": "-zst"}
+
+
+def choose_encoding(request: Request):
+    """Pick the best content-coding the client accepts, or None for identity."""
+    accepted = {}
+    for part in request.headers.get("accept-encoding", "").split(","):
+        token, _, params = part.strip().partition(";")
+        token = token.strip().lower()
+        if not token:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[token] = q
+
+    for encoding in SUPPORTED_ENCODINGS:
+        q = accepted.get(encoding, accepted.get("*", 0.0))
+        if q > 0:
+            return encoding
+    return None
+
+
+def compress(body: bytes, encoding, level=None) -> bytes:
+    if encoding == "zstd":
+        # ZstdCompressor instances are not thread-safe, so build one per call
+        return zstandard.ZstdCompressor(level=level or 3).compress(body)
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=level or 6, mtime=0)
+    return body
+
+
+def make_etag(body: bytes) -> str:
+    return f'"{xxhash.xxh3_64_hexdigest(body)}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # If-None-Match uses weak comparison, so a W/ prefix is ignored
+    candidates = [tag.strip().removeprefix("W/") for tag in header.split(",")]
+    return etag in candidates
+
+
+def _cached_response(request: Request, variants: dict, etag: str, media_type: str) -> Response:
+    encoding = choose_encoding(request)
+    if encoding not in variants:
+        encoding = None
+    variant_etag = etag[:-1] + ETAG_SUFFIX[encoding] + '"'
+    headers = {
+        "ETag": variant_etag,
+        "Vary": "Accept-Encoding",
+        "Cache-Control": "no-cache",
+    }
+    if etag_matches(request, variant_etag):
+        return Response(status_code=304, headers=headers)
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(content=variants[encoding], media_type=media_type, headers=headers)
+
+
+class StaticPage:
+    """An HTML file from the static folder, read and pre-compressed once."""
+
+    def __init__(self, filename: str):
+        with open(os.path.join(STATIC_DIR, filename), "rb") as f:
+            body = f.read()
+        self.etag = make_etag(body)
+        self.variants = {None: body}
+        if len(body) >= MIN_COMPRESS_SIZE:
+            self.variants["gzip"] = compress(body, "gzip", level=9)
+            self.variants["zstd"] = compress(body, "zstd", level=19)
+
+    def response(self, request: Request) -> Response:
+        return _cached_response(request, self.variants, self.etag, "text/html; charset=utf-8")
+
+
+def json_response(request: Request, content) -> Response:
+    """
+    JSON response with a strong ETag. Answers 304 when the client already holds
+    the current representation, otherwise compresses by Accept-Encoding.
+    """
+    body = json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    variants = {None: body}
+    encoding = choose_encoding(request)
+    if encoding and len(body) >= MIN_COMPRESS_SIZE:
+        variants[encoding] = compress(body, encoding)
+    return _cached_response(request, variants, make_etag(body), "application/json")
+
+
+def compressed_stream(request: Request, chunks, media_type: str = "text/plain") -> StreamingResponse:
+    """
+    Stream a sync iterator of str/bytes, compressed by Accept-Encoding. Every
+    chunk is flushed so the client still sees progress as it is produced.
+    """
+    encoding = choose_encoding(request)
+    if encoding is None:
+        return StreamingResponse(chunks, media_type=media_type)
+
+    def encode():
+        if encoding == "zstd":
+            compressor = zstandard.ZstdCompressor(level=3).compressobj()
+            flush_mode = zstandard.COMPRESSOBJ_FLUSH_BLOCK
+        else:
+            compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            flush_mode = zlib.Z_SYNC_FLUSH
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode("utf-8")
+            data = compressor.compress(chunk) + compressor.flush(flush_mode)
+            if data:
+                yield data
+        yield compressor.flush()
+
+    headers = {"Content-Encoding": encoding, "Vary": "Accept-Encoding"}
+    return StreamingResponse(encode(), media_type=media_type, headers=headers)
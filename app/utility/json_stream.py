@@ -0,0 +1,145 @@
+import json
+import re
+
+# Models often emit LaTeX with single backslashes inside JSON strings. Invalid
+# escapes such as \alpha or \sqrt break parsing, while \frac or \beta parse
+# "successfully" into form feeds and backspaces. Every escape is matched left
+# to right, so valid pairs like \\ and \" are left intact.
+_ESCAPE = re.compile(r'\\(u[0-9a-fA-F]{4}|[A-Za-z]+|.)', re.DOTALL)
+_VALID_ESCAPES = set('"\\/nrtu')
+# \n, \r and \t followed by letters are ambiguous: "\nu" is either LaTeX or a
+# newline before "u". These are only rewritten for output that fails to parse
+# or comes from a model without a response schema.
+_LATEX_COMMANDS = {
+    "nabla", "ne", "neg", "neq", "nexists", "ngeq", "ni", "nleq", "not", "notin", "nu",
+    "rangle", "rceil", "rfloor", "rho", "right", "rightarrow", "rightleftharpoons", "rm", "rvert",
+    "tan", "tanh", "tau", "text", "textbf", "textit", "textrm", "texttt", "tfrac",
+    "therefore", "theta", "tilde", "times", "to", "top", "triangle",
+}
+# Candidates starting like a JSON object; other braces are prose, e.g. "{1,2}"
+_JSON_OBJECT_START = re.compile(r'\{\s*"')
+
+
+def _repair_escapes(text: str, latex: bool = False) -> str:
+    def repair(match):
+        escape = match.group(1)
+        if escape[0] not in _VALID_ESCAPES:
+            # Includes \b and \f, which never belong in quiz text
+            return "\\\\" + escape
+        if escape[0] == "u" and len(escape) != 5:
+            return "\\\\" + escape  # \underline, \uparrow
+        if latex and escape[0] in "nrt" and escape in _LATEX_COMMANDS:
+            return "\\\\" + escape
+        return match.group(0)
+
+    return _ESCAPE.sub(repair, text)
+
+
+def _loads(text: str):
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        return None
+
+
+class JSONObjectStream:
+    r"""
+    Incrementally pulls complete JSON objects out of streamed model output.
+
+    Objects are emitted as soon as their closing brace arrives, whether they
+    sit at the top level or inside a top-level array. Anything outside of
+    brackets (code fences, stray prose) is ignored. An object that fails to
+    parse is dropped on its own instead of discarding the whole response.
+
+    >>> JSONObjectStream().feed(r'[{"q": "Statements:\ni) A\nii) B"}, {"q": "\frac{1}{2}"}]')
+    [{'q': 'Statements:\ni) A\nii) B'}, {'q': '\\frac{1}{2}'}]
+    >>> JSONObjectStream(latex_escapes=True).feed(r'{"q": "\nu = 2 \theta"}')
+    [{'q': '\\nu = 2 \\theta'}]
+    >>> stream = JSONObjectStream()
+    >>> stream.feed('Here is {the output}: [{"q": 1}, {"q": 2')
+    [{'q': 1}]
+    >>> stream.close()
+    1
+    """
+
+    def __init__(self, validate=None, latex_escapes=False):
+        self.validate = validate
+        # Set for output without a response schema, where "\nu" is far more
+        # likely LaTeX than a newline
+        self.latex_escapes = latex_escapes
+        self.buffer = ""
+        self.pos = 0
+        self.stack = []
+        self.in_string = False
+        self.escape = False
+        self.start = None
+        self.start_depth = 0
+        self.emitted = 0
+        self.dropped = 0
+
+    def feed(self, text: str) -> list:
+        self.buffer += text
+        buf = self.buffer
+        objects = []
+        i = self.pos
+        while i < len(buf):
+            ch = buf[i]
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif ch == "\\":
+                    self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+            elif ch == '"':
+                # Quotes outside any container belong to prose, not JSON
+                if self.stack:
+                    self.in_string = True
+            elif ch in "[{":
+                if ch == "{" and self.start is None and self.stack in ([], ["["]):
+                    self.start = i
+                    self.start_depth = len(self.stack)
+                self.stack.append(ch)
+            elif ch in "]}":
+                if self.stack:
+                    self.stack.pop()
+                if ch == "}" and self.start is not None and len(self.stack) == self.start_depth:
+                    obj = self._parse(buf[self.start:i + 1])
+                    if obj is not None:
+                        objects.append(obj)
+                    self.start = None
+            i += 1
+
+        # Only the unfinished object (if any) needs to be kept around
+        if self.start is not None:
+            self.buffer = buf[self.start:]
+            self.start = 0
+        else:
+            self.buffer = ""
+        self.pos = len(self.buffer)
+        return objects
+
+    def close(self) -> int:
+        """Finish the stream; an unterminated trailing object counts as dropped."""
+        if self.start is not None:
+            self._drop(self.buffer[self.start:])
+            self.start = None
+        self.buffer = ""
+        self.pos = 0
+        return self.dropped
+
+    def _parse(self, text: str):
+        # Candidates always start with "{", so None never stands for a JSON null
+        obj = None if self.latex_escapes else _loads(_repair_escapes(text))
+        if obj is None:
+            obj = _loads(_repair_escapes(text, latex=True))
+        if obj is None or (self.validate is not None and not self.validate(obj)):
+            self._drop(text)
+            return None
+        self.emitted += 1
+        return obj
+
+    def _drop(self, text: str):
+        # Braces in prose around the JSON ("the set {1,2}") are not lost objects
+        if self.start_depth == 1 or _JSON_OBJECT_START.match(text):
+            self.dropped += 1
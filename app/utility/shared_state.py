@@ -0,0 +1,207 @@
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from pymongo import ReturnDocument
+
+# "memory" keeps state per process; use "mongo" when running several uvicorn workers
+SHARED_STATE_BACKEND = os.getenv("SHARED_STATE_BACKEND", "memory")
+
+
+class InMemorySharedState:
+    """
+    Process-local backend. Fine for a single worker and for tests; with
+    several workers every process sees its own copy.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.values = {}
+        self.jobs = {}
+        self.buckets = {}
+
+    @staticmethod
+    def _expiry(ttl):
+        return time.monotonic() + ttl if ttl else None
+
+    @staticmethod
+    def _alive(entry) -> bool:
+        return entry is not None and (entry[1] is None or entry[1] > time.monotonic())
+
+    # Key/value cache
+    def get(self, key: str):
+        with self.lock:
+            entry = self.values.get(key)
+            return entry[0] if self._alive(entry) else None
+
+    def set(self, key: str, value, ttl: float = None):
+        with self.lock:
+            self.values[key] = (value, self._expiry(ttl))
+
+    def delete(self, key: str):
+        with self.lock:
+            self.values.pop(key, None)
+
+    def incr(self, key: str, amount: int = 1, ttl: float = None) -> int:
+        with self.lock:
+            entry = self.values.get(key)
+            if not self._alive(entry):
+                entry = (0, self._expiry(ttl))
+            value = entry[0] + amount
+            self.values[key] = (value, entry[1])
+            return value
+
+    # Job status
+    def put_job(self, job_id: str, fields: dict, ttl: float = None):
+        with self.lock:
+            self.jobs[job_id] = (dict(fields), self._expiry(ttl))
+
+    def get_job(self, job_id: str):
+        with self.lock:
+            entry = self.jobs.get(job_id)
+            return dict(entry[0]) if self._alive(entry) else None
+
+    # Rate limiting
+    def take_token(self, key: str, rate: float, capacity: float, cost: float = 1) -> float:
+        """
+        Token bucket refilled at `rate` tokens/second up to `capacity`. Takes
+        `cost` tokens and returns 0, or returns the seconds to wait before
+        enough tokens are available.
+        """
+        with self.lock:
+            now = time.monotonic()
+            tokens, updated = self.buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            if tokens >= cost:
+                self.buckets[key] = (tokens - cost, now)
+                return 0.0
+            self.buckets[key] = (tokens, now)
+            return (cost - tokens) / rate
+
+
+class MongoSharedState:
+    """
+    Backend shared by every worker through MongoDB. Each operation is a single
+    atomic document update, and TTL indexes on `expires_at` clean up stale
+    entries (reads also filter on it, as the TTL monitor only runs every minute).
+    """
+
+    def __init__(self, db, prefix: str = "shared_"):
+        self.values = db[f"{prefix}kv"]
+        self.jobs = db[f"{prefix}jobs"]
+        self.buckets = db[f"{prefix}buckets"]
+        self._indexed = False
+        self._index_lock = threading.Lock()
+
+    def _ensure_indexes(self):
+        if self._indexed:
+            return
+        with self._index_lock:
+            if not self._indexed:
+                for collection in (self.values, self.jobs, self.buckets):
+                    collection.create_index("expires_at", expireAfterSeconds=0)
+                self._indexed = True
+
+    @staticmethod
+    def _expiry(ttl):
+        return datetime.now(timezone.utc) + timedelta(seconds=ttl) if ttl else None
+
+    @staticmethod
+    def _alive_filter(key: str) -> dict:
+        return {
+            "_id": key,
+            "$or": [{"expires_at": None}, {"expires_at": {"$gt": datetime.now(timezone.utc)}}],
+        }
+
+    # Key/value cache
+    def get(self, key: str):
+        self._ensure_indexes()
+        doc = self.values.find_one(self._alive_filter(key), {"value": 1})
+        return doc["value"] if doc else None
+
+    def set(self, key: str, value, ttl: float = None):
+        self._ensure_indexes()
+        self.values.replace_one(
+            {"_id": key}, {"value": value, "expires_at": self._expiry(ttl)}, upsert=True
+        )
+
+    def delete(self, key: str):
+        self.values.delete_one({"_id": key})
+
+    def incr(self, key: str, amount: int = 1, ttl: float = None) -> int:
+        self._ensure_indexes()
+        # Reset a counter whose TTL passed but which the TTL monitor has not removed yet
+        self.values.delete_one({"_id": key, "expires_at": {"$lte": datetime.now(timezone.utc)}})
+        doc = self.values.find_one_and_update(
+            {"_id": key},
+            {"$inc": {"value": amount}, "$setOnInsert": {"expires_at": self._expiry(ttl)}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        return doc["value"]
+
+    # Job status
+    def put_job(self, job_id: str, fields: dict, ttl: float = None):
+        self._ensure_indexes()
+        self.jobs.replace_one({"_id": job_id}, {**fields, "expires_at": self._expiry(ttl)}, upsert=True)
+
+    def get_job(self, job_id: str):
+        doc = self.jobs.find_one(self._alive_filter(job_id), {"_id": 0, "expires_at": 0})
+        return doc
+
+    # Rate limiting
+    def take_token(self, key: str, rate: float, capacity: float, cost: float = 1) -> float:
+        """
+        Same contract as InMemorySharedState.take_token. Refill and take happen
+        in one pipeline update using the server clock, so worker clock skew
+        does not matter.
+        """
+        self._ensure_indexes()
+        elapsed = {"$divide": [{"$subtract": ["$$NOW", {"$ifNull": ["$updated_at", "$$NOW"]}]}, 1000]}
+        refilled = {"$min": [capacity, {"$add": [{"$ifNull": ["$tokens", capacity]}, {"$multiply": [elapsed, rate]}]}]}
+        doc = self.buckets.find_one_and_update(
+            {"_id": key},
+            [
+                {"$set": {"tokens": refilled, "updated_at": "$$NOW"}},
+                {"$set": {"granted": {"$gte": ["$tokens", cost]}}},
+                {"$set": {
+                    "tokens": {"$cond": ["$granted", {"$subtract": ["$tokens", cost]}, "$tokens"]},
+                    # An idle bucket is full again after capacity / rate seconds
+                    "expires_at": {"$add": ["$$NOW", int(capacity / rate * 1000) + 60_000]},
+                }},
+            ],
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        if doc["granted"]:
+            return 0.0
+        return (cost - doc["tokens"]) / rate
+
+
+def acquire_token(state, key: str, rate: float, capacity: float, cost: float = 1):
+    """Block until the token bucket `key` grants `cost` tokens."""
+    while True:
+        wait = state.take_token(key, rate, capacity, cost)
+        if not wait:
+            return
+        time.sleep(wait)
+
+
+_shared_state = None
+_shared_state_lock = threading.Lock()
+
+
+def get_shared_state():
+    global _shared_state
+    if _shared_state is None:
+        with _shared_state_lock:
+            if _shared_state is None:
+                if SHARED_STATE_BACKEND == "mongo":
+                    from utility.mongo_client import db
+                    _shared_state = MongoSharedState(db)
+                elif SHARED_STATE_BACKEND == "memory":
+                    _shared_state = InMemorySharedState()
+                else:
+                    raise ValueError(f"Unknown SHARED_STATE_BACKEND: {SHARED_STATE_BACKEND}")
+    return _shared_state
@@ -0,0 +1,97 @@
+"""
+Spawn several worker processes against the shared-state backend and check
+that they behave as one service: counters add up, token buckets enforce one
+global rate and every worker sees every job.
+
+Usage (from app/):
+    SHARED_STATE_BACKEND=mongo python -m utility.shared_state_harness --workers 4
+
+With the default "memory" backend the checks are expected to fail, since each
+process keeps its own state.
+"""
+import argparse
+import multiprocessing
+import os
+import time
+from uuid import uuid4
+
+
+def worker(index, args, prefix, start_at, results):
+    # Imported in the child so every process builds its own client/backend
+    from utility.shared_state import get_shared_state
+
+    state = get_shared_state()
+    counter_key = f"{prefix}:counter"
+    bucket_key = f"{prefix}:bucket"
+
+    while time.time() < start_at:
+        time.sleep(0.01)
+
+    for _ in range(args.increments):
+        state.incr(counter_key, ttl=300)
+
+    granted = 0
+    deadline = time.time() + args.seconds
+    while time.time() < deadline:
+        if state.take_token(bucket_key, rate=args.rate, capacity=args.capacity) == 0:
+            granted += 1
+        else:
+            time.sleep(0.005)
+
+    state.put_job(f"{prefix}:job:{index}", {"worker": index, "pid": os.getpid()}, ttl=300)
+    # Give the other workers time to publish their jobs before looking
+    time.sleep(1.0)
+    seen = sum(1 for i in range(args.workers) if state.get_job(f"{prefix}:job:{i}"))
+
+    results.put({
+        "worker": index,
+        "counter": state.incr(counter_key, amount=0),
+        "granted": granted,
+        "jobs_seen": seen,
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--increments", type=int, default=200)
+    parser.add_argument("--seconds", type=float, default=3.0, help="how long workers hammer the token bucket")
+    parser.add_argument("--rate", type=float, default=20.0, help="token bucket refill rate per second")
+    parser.add_argument("--capacity", type=float, default=10.0)
+    args = parser.parse_args()
+
+    ctx = multiprocessing.get_context("spawn")
+    results = ctx.Queue()
+    prefix = f"harness:{uuid4().hex}"
+    start_at = time.time() + 2.0
+    processes = [
+        ctx.Process(target=worker, args=(i, args, prefix, start_at, results))
+        for i in range(args.workers)
+    ]
+    for process in processes:
+        process.start()
+    reports = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    expected_count = args.workers * args.increments
+    final_count = max(report["counter"] for report in reports)
+    granted = sum(report["granted"] for report in reports)
+    allowed = args.capacity + args.rate * args.seconds
+    checks = [
+        ("counter", final_count == expected_count, f"{final_count} / expected {expected_count}"),
+        # Slack for workers that start or stop slightly off the common schedule
+        ("token bucket", granted <= allowed * 1.1, f"{granted} granted / allowed ~{allowed:.0f}"),
+        ("jobs", all(r["jobs_seen"] == args.workers for r in reports),
+         ", ".join(f"w{r['worker']} saw {r['jobs_seen']}" for r in sorted(reports, key=lambda r: r["worker"]))),
+    ]
+
+    backend = os.getenv("SHARED_STATE_BACKEND", "memory")
+    print(f"Backend: {backend}, workers: {args.workers}")
+    for name, ok, detail in checks:
+        print(f"{'PASS' if ok else 'FAIL'}  {name:<13} {detail}")
+    return 0 if all(ok for _, ok, _ in checks) else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())